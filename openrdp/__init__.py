@@ -245,10 +245,13 @@ class Scanner:
             if os.path.exists(bootscan.dt_matrix_file):
                 os.remove(bootscan.dt_matrix_file)
 
+        if 'siscan' in tmethods:
+            tmethods['siscan'].execute_all(total_combinations=total_num_trps, seq_names=self.seq_names)
+
         for trp_count, triplet in enumerate(TripletGenerator(self.alignment, self.seq_names)):
             self.print("Scanning triplet {} / {}".format(trp_count, total_num_trps))
             for alias, tmethod in tmethods.items():
-                if alias == 'bootscan':
+                if alias in ['bootscan', 'siscan']:
                     continue
                 tmethod.execute(triplet)
 
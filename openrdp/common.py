@@ -2,7 +2,6 @@ from itertools import combinations
 
 import numpy as np
 from scipy.stats import chi2_contingency
-from scipy.stats import pearsonr
 import copy
 import sys
 
@@ -93,13 +92,49 @@ def jc_distance(s1, s2):
     return -0.75 * np.log(1 - (p_dist * 4 / 3)) if p_dist else 0
 
 
-def all_items_equal(x):
+def jc_distance_matrix(seqs):
     """
-    Check if all items in a list are identical
-    :param x: the list
-    :return: True if all the items are identical, false otherwise
+    Calculate the pairwise Jukes-Cantor distances between all sequences at once
+    :param seqs: an n x m array of sequences
+    :return: an n x n matrix of pairwise JC69 distances
     """
-    return x.count(x[0]) == len(x)
+    # Only compare positions where both sequences have a nucleotide
+    valid = np.isin(seqs, ['A', 'T', 'G', 'C'])
+    pair_valid = valid[:, None, :] & valid[None, :, :]
+    num_valid = pair_valid.sum(axis=-1)
+    diffs = ((seqs[:, None, :] != seqs[None, :, :]) & pair_valid).sum(axis=-1)
+    p_dist = np.divide(diffs, num_valid, out=np.zeros(num_valid.shape), where=num_valid > 0)
+
+    # Apply the JC69 correction, saturating at p-distances of 0.75 or more
+    dists = np.ones(p_dist.shape)
+    close = p_dist < 0.75
+    dists[close] = -0.75 * np.log(1 - (p_dist[close] * 4 / 3))
+    dists[p_dist == 0] = 0
+    return dists
+
+
+def pearson_r(x, y):
+    """
+    Calculate Pearson's correlation coefficient between 2 lists, without the p-value that
+    scipy.stats.pearsonr also computes
+    :param x: the first list
+    :param y: the second list
+    :return: the correlation coefficient, or NaN if either list is constant
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if np.ptp(x) == 0 or np.ptp(y) == 0:
+        return float('NaN')
+
+    # Two points always lie on a line, so take the sign directly to avoid rounding errors
+    if len(x) == 2:
+        return np.sign(x[1] - x[0]) * np.sign(y[1] - y[0])
+
+    # Normalise the centred lists before taking the dot product, as scipy does
+    xm = x - x.mean()
+    ym = y - y.mean()
+    r = np.dot(xm / np.linalg.norm(xm), ym / np.linalg.norm(ym))
+    return max(min(r, 1.0), -1.0)
 
 
 def identify_recombinant(trp, aln_pos):
@@ -109,34 +144,17 @@ def identify_recombinant(trp, aln_pos):
     in homologous sequences. Mol Biol Evol 15: 326–335
     :return: name of the recombinant sequence and the names of the parental sequences
     """
-    upstream_dists = []
-    downstream_dists = []
+    # Calculate pairwise Jukes-Cantor distances for regions upstream and downstream of breakpoint
+    upstream = jc_distance_matrix(trp.sequences[:, 0: aln_pos[0]])
+    downstream = jc_distance_matrix(trp.sequences[:, aln_pos[1]: trp.sequences.shape[1]])
 
     # Get possible breakpoint locations
-    for i in range(len(trp.names)):
-        upstream_dists.append([])
-        downstream_dists.append([])
-        for j in range(len(trp.names)):
-            if i != j:
-                # Calculate pairwise Jukes-Cantor distances for regions upstream and downstream of breakpoint
-                upstream_dists[i].append(jc_distance(trp.sequences[i][0: aln_pos[0]],
-                                                     trp.sequences[j][0: aln_pos[0]]))
-                downstream_dists[i].append(jc_distance(trp.sequences[i][aln_pos[1]: trp.sequences.shape[1]],
-                                                       trp.sequences[j][aln_pos[1]: trp.sequences.shape[1]]))
-
-    # Calculate Pearson's correlation coefficient for 2 lists
-    r_coeff = [0, 0, 0]
-    if all_items_equal(upstream_dists[0]) or all_items_equal(downstream_dists[0]):
-        r_coeff[0] = float('NaN')
-    elif all_items_equal(upstream_dists[1]) or all_items_equal(downstream_dists[1]):
-        r_coeff[1] = float('NaN')
-    elif all_items_equal(upstream_dists[2]) or all_items_equal(downstream_dists[2]):
-        r_coeff[2] = float('NaN')
-
-    else:
-        r_coeff[0], _ = pearsonr(upstream_dists[0], downstream_dists[0])
-        r_coeff[1], _ = pearsonr(upstream_dists[1], downstream_dists[1])
-        r_coeff[2], _ = pearsonr(upstream_dists[2], downstream_dists[2])
+    num_seqs = len(trp.names)
+    upstream_dists = [[upstream[i, j] for j in range(num_seqs) if i != j] for i in range(num_seqs)]
+    downstream_dists = [[downstream[i, j] for j in range(num_seqs) if i != j] for i in range(num_seqs)]
+
+    # Calculate Pearson's correlation coefficient for 2 lists (NaN for a constant list)
+    r_coeff = [pearson_r(upstream_dists[i], downstream_dists[i]) for i in range(num_seqs)]
 
     # Most likely recombinant sequence is sequence with lowest coefficient
     trp_names = copy.copy(trp.names)
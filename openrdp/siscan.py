@@ -1,15 +1,113 @@
-import random
+import multiprocessing
+import os
+from itertools import permutations
+from operator import itemgetter
 
 import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 from scipy.ndimage import gaussian_filter1d
 from scipy.signal import find_peaks
 
-from .common import identify_recombinant
+from .common import identify_recombinant, TripletGenerator
+
+try:
+    from numba import njit, prange, set_num_threads
+    _NUMBA_AVAILABLE = True
+except ImportError:
+    _NUMBA_AVAILABLE = False
+
+
+def match_patterns(ab, bc, ac, ad, cd, bd):
+    """
+    Evaluate the 15 site patterns of Gibbs, Armstrong, and Gibbs (2000) from the pairwise identities
+    :param ab: identity of sequences a and b, likewise for the other pairs
+    :return: list of 15 masks, one for each pattern
+    """
+    # Negate each identity once, rather than once per pattern
+    nab, nbc, nac, nad, ncd, nbd = ~ab, ~bc, ~ac, ~ad, ~cd, ~bd
+
+    return [nab & nac & nad & nbc & nbd & ncd,
+            ab & nac & nad,
+            ac & nab & nad,
+            ad & nab & nac,
+            bc & nab & nbd,
+            bd & nab & nbc,
+            cd & nbc & nac,
+            ab & cd & nbc,
+            ac & bd & nbc,
+            ad & bc & nab,
+            ab & bc & nad,
+            ab & bd & nac,
+            ac & cd & nab,
+            bc & cd & nab,
+            ab & bc & ad]
+
+
+# Pairs of sequences (ab, bc, ac, ad, cd, bd), in the order of the bits of a site code
+PAIRS = ((0, 1), (1, 2), (0, 2), (0, 3), (2, 3), (1, 3))
+
+# Map each 6-bit site code (bits set for identical pairs) to the patterns it conforms to
+PATTERN_LUT = np.array(match_patterns(*[(np.arange(64) >> k & 1).astype(bool) for k in range(6)]), dtype=np.int64)
+
+
+def permute_code(code, perm):
+    """
+    Find the site code of a site after its 4 rows are reordered
+    :param code: 6-bit site code, with the bits of identical pairs set
+    :param perm: the new order of the rows, where row i of the shuffled site is row perm[i] of the original site
+    :return: the site code of the shuffled site
+    """
+    new_code = 0
+    for k, (i, j) in enumerate(PAIRS):
+        # Pair (i, j) of the shuffled site is pair (perm[i], perm[j]) of the original site
+        old_k = PAIRS.index(tuple(sorted((perm[i], perm[j]))))
+        new_code |= (code >> old_k & 1) << k
+    return new_code
+
+
+# Orders of the 4 rows of a site (a vertically randomized site takes one of them, chosen uniformly),
+# and the site code each of them turns every site code into
+ROW_PERMS = np.array(list(permutations(range(4))), dtype=np.intp)
+PERM_CODES = np.array([[permute_code(code, perm) for code in range(64)] for perm in ROW_PERMS], dtype=np.uint8)
+
+# Size in bytes of the row orders drawn for a tile of windows, chosen to stay within a typical L2 cache
+TILE_BYTES = 256 * 1024
+
+
+if _NUMBA_AVAILABLE:
+    @njit(cache=True, parallel=True)
+    def count_permuted_patterns(codes, perm_ids, perm_codes, pattern_lut):
+        """
+        Count the patterns of vertically randomized copies of a tile of windows, compiled with Numba
+        :param codes: a windows x n array of the site codes of each window
+        :param perm_ids: a windows x n_perm x n array, the index into ROW_PERMS of the order of the rows at each site
+                         of each copy
+        :param perm_codes: PERM_CODES, the site code each row order turns every site code into
+        :param pattern_lut: PATTERN_LUT, the patterns each site code conforms to
+        :return: windows x n_perm x 15 array of counts corresponding to each pattern
+        """
+        num_windows, n_perm, win_size = perm_ids.shape
+        p_counts = np.zeros((num_windows, n_perm, 15), dtype=np.int64)
+
+        # Spread the windows over threads, each running all the permutations of a window with one histogram
+        for w in prange(num_windows):
+            code_counts = np.empty(64, dtype=np.int64)
+            for p in range(n_perm):
+                code_counts[:] = 0
+                for k in range(win_size):
+                    code_counts[perm_codes[perm_ids[w, p, k], codes[w, k]]] += 1
+
+                for c in range(64):
+                    if code_counts[c]:
+                        for q in range(15):
+                            p_counts[w, p, q] += code_counts[c] * pattern_lut[q, c]
+
+        return p_counts
 
 
 class Siscan:
     def __init__(self, align, win_size=200, step_size=20, strip_gaps=True, pvalue_perm_num=1100,
-                 scan_perm_num=100, random_seed=3, max_pvalue=0.05, settings=None, quiet=False):
+                 scan_perm_num=100, random_seed=3, max_pvalue=0.05, num_processes=None, settings=None, quiet=False):
         """
         Constructs a Siscan object
         :param win_size: the size of the sliding window
@@ -18,6 +116,7 @@ class Siscan:
         :param pvalue_perm_num: p-value permutation number
         :param scan_perm_num: number of permutations of the scans
         :param random_seed: the random seed
+        :param num_processes: number of processes used to scan triplets in parallel, defaults to the CPU count
         """
         self.align = align
         if settings:
@@ -31,10 +130,14 @@ class Siscan:
             self.scan_perm_num = scan_perm_num
             self.random_seed = random_seed
             self.max_pvalue = max_pvalue
+            self.np = num_processes if num_processes else os.cpu_count()
 
+        self.quiet = quiet
         self.raw_results = []
         self.results = []
         self.name = 'siscan'
+        self.seq_names = None
+        self.total_triplet_combinations = 0
 
     def set_options_from_config(self, settings):
         """
@@ -53,6 +156,7 @@ class Siscan:
         self.pvalue_perm_num = int(settings['pvalue_perm_num'])
         self.scan_perm_num = int(settings['scan_perm_num'])
         self.random_seed = int(settings['random_seed'])
+        self.np = int(settings.get('np', os.cpu_count()))
 
     def validate_options(self, align):
         """
@@ -79,147 +183,231 @@ class Siscan:
             print("Invalid option for 'random_seed'.\nUsing default value (3) instead.")
             self.random_seed = 3
 
+        if self.np <= 0:
+            print(f"Invalid option for 'np'.\nUsing default value ({os.cpu_count()}) instead.")
+            self.np = os.cpu_count()
+
+    def get_options(self):
+        """
+        Get the options of Siscan, so that another Siscan object can be constructed with the same options
+        :return: a dictionary of keyword arguments of the constructor
+        """
+        return {'win_size': self.win_size, 'step_size': self.step_size, 'strip_gaps': self.strip_gaps,
+                'pvalue_perm_num': self.pvalue_perm_num, 'scan_perm_num': self.scan_perm_num,
+                'random_seed': self.random_seed, 'max_pvalue': self.max_pvalue, 'num_processes': self.np,
+                'quiet': self.quiet}
+
+    @staticmethod
+    def site_codes(seq_array):
+        """
+        Encode the identities of the 6 pairs of sequences at each site as a 6-bit code
+        :param seq_array: a 4 x n array of sequences, optionally preceded by any number of batch dimensions
+        :return: n vector of site codes, with the same batch dimensions
+        """
+        # Pack one pair at a time into a single byte buffer
+        codes = np.equal(seq_array[..., 0, :], seq_array[..., 1, :]).view(np.uint8)
+        bits = np.empty_like(codes)
+        for k, (i, j) in enumerate(PAIRS[1:], 1):
+            np.equal(seq_array[..., i, :], seq_array[..., j, :], out=bits.view(bool))
+            bits <<= k
+            codes |= bits
+
+        return codes
+
+    @staticmethod
+    def count_codes(codes):
+        """
+        Count the number of sites that conform to each of the 15 patterns from their site codes
+        :param codes: n vector of site codes, optionally preceded by any number of batch dimensions
+        :return: vector of counts corresponding to each pattern, with the same batch dimensions
+        """
+        batch_shape = codes.shape[:-1]
+        codes = codes.reshape(-1, codes.shape[-1])
+
+        # Offset the codes of each batch entry so that a single bincount covers the whole batch,
+        # using the narrowest integer type that holds the offsets
+        offsets = 64 * np.arange(codes.shape[0], dtype=np.min_scalar_type(64 * codes.shape[0]))[:, None]
+        code_counts = np.bincount((codes + offsets).ravel(), minlength=64 * codes.shape[0])
+
+        return (code_counts.reshape(-1, 64) @ PATTERN_LUT.T).reshape(batch_shape + (15,))
+
     @staticmethod
     def count_patterns(seq_array):
-        a = seq_array[0]
-        b = seq_array[1]
-        c = seq_array[2]
-        d = seq_array[3]
-
-        pat_counts = [0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0]
-
-        ab = a == b
-        bc = b == c
-        ac = a == c
-        ad = a == d
-        cd = c == d
-        bd = b == d
-        np.logical_not(cd)
-
-        pat_counts[0] = np.sum(np.logical_not(ab) & np.logical_not(ac) & np.logical_not(ad) & np.logical_not(bc) & np.logical_not(bd) & np.logical_not(cd))
-        pat_counts[1] = np.sum(ab & np.logical_not(ac) & np.logical_not(ad))
-        pat_counts[2] = np.sum(ac & np.logical_not(ab) & np.logical_not(ad))
-        pat_counts[3] = np.sum(ad & np.logical_not(ab) & np.logical_not(ac))
-        pat_counts[4] = np.sum(bc & np.logical_not(ab) & np.logical_not(bd))
-        pat_counts[5] = np.sum(bd & np.logical_not(ab) & np.logical_not(bc))
-        pat_counts[6] = np.sum(cd & np.logical_not(bc) & np.logical_not(ac))
-        pat_counts[7] = np.sum(ab & cd & np.logical_not(bc))
-        pat_counts[8] = np.sum(ac & bd & np.logical_not(bc))
-        pat_counts[9] = np.sum(ad & bc & np.logical_not(ab))
-        pat_counts[10] = np.sum(ab & bc & np.logical_not(ad))
-        pat_counts[11] = np.sum(ab & bd & np.logical_not(ac))
-        pat_counts[12] = np.sum(ac & cd & np.logical_not(ab))
-        pat_counts[13] = np.sum(bc & cd & np.logical_not(ab))
-        pat_counts[14] = np.sum(ab & bc & ad)
-
-        return pat_counts
+        """
+        Count the number of sites in a window that conform to each of the 15 patterns
+        :param seq_array: a 4 x n array of sequences, optionally preceded by any number of batch dimensions
+        :return: vector of counts corresponding to each pattern, with the same batch dimensions
+        """
+        return Siscan.count_codes(Siscan.site_codes(seq_array))
+
+    @staticmethod
+    def count_permuted_codes(codes, perm_ids):
+        """
+        Count the patterns of vertically randomized copies of windows, where the 4 rows of each site are shuffled
+        :param codes: a windows x n array of the site codes of each window
+        :param perm_ids: a windows x n_perm x n array, the index into ROW_PERMS of the order of the rows at each site
+                         of each copy
+        :return: windows x n_perm x 15 array of counts corresponding to each pattern
+        """
+        # Shuffling the rows of a site only reorders its pairs, so look up the shuffled site code directly
+        return Siscan.count_codes(PERM_CODES[perm_ids, codes[:, None, :]])
 
     @staticmethod
     def sum_pattern_counts(pat_counts):
         """
         Sum counts where 2 sequences are identical
-        :param pat_counts: vector of counts corresponding to each pattern
+        :param pat_counts: vector of counts corresponding to each pattern, optionally preceded by batch dimensions
         :return: vector of summed counts
         """
-        sum_pat_counts = [0, 0, 0, 0, 0, 0, 0, 0, 0]
+        sum_pat_counts = np.zeros(pat_counts.shape[:-1] + (9,), dtype=pat_counts.dtype)
 
-        sum_pat_counts[3] = pat_counts[1] + pat_counts[7] + pat_counts[10] + pat_counts[11]  # 2 + 8 + 11 + 12
-        sum_pat_counts[4] = pat_counts[2] + pat_counts[8] + pat_counts[10] + pat_counts[12]  # 3 + 9 + 11 + 13
-        sum_pat_counts[5] = pat_counts[3] + pat_counts[9] + pat_counts[11] + pat_counts[12]  # 4 + 10 + 12 + 13
-        sum_pat_counts[6] = pat_counts[4] + pat_counts[9] + pat_counts[10] + pat_counts[13]  # 5 + 10 + 11 + 14
-        sum_pat_counts[7] = pat_counts[5] + pat_counts[8] + pat_counts[11] + pat_counts[13]  # 6 + 9 + 12 + 14
-        sum_pat_counts[8] = pat_counts[6] + pat_counts[7] + pat_counts[12] + pat_counts[13]  # 7 + 8 + 13 + 14
+        sum_pat_counts[..., 3] = pat_counts[..., 1] + pat_counts[..., 7] + pat_counts[..., 10] + pat_counts[..., 11]  # 2 + 8 + 11 + 12
+        sum_pat_counts[..., 4] = pat_counts[..., 2] + pat_counts[..., 8] + pat_counts[..., 10] + pat_counts[..., 12]  # 3 + 9 + 11 + 13
+        sum_pat_counts[..., 5] = pat_counts[..., 3] + pat_counts[..., 9] + pat_counts[..., 11] + pat_counts[..., 12]  # 4 + 10 + 12 + 13
+        sum_pat_counts[..., 6] = pat_counts[..., 4] + pat_counts[..., 9] + pat_counts[..., 10] + pat_counts[..., 13]  # 5 + 10 + 11 + 14
+        sum_pat_counts[..., 7] = pat_counts[..., 5] + pat_counts[..., 8] + pat_counts[..., 11] + pat_counts[..., 13]  # 6 + 9 + 12 + 14
+        sum_pat_counts[..., 8] = pat_counts[..., 6] + pat_counts[..., 7] + pat_counts[..., 12] + pat_counts[..., 13]  # 7 + 8 + 13 + 14
 
         return sum_pat_counts
 
+    def get_windows(self, seqs):
+        """
+        View all full windows of a set of aligned sequences at once, based on the leading edge of the window
+        A window longer than the alignment covers the whole alignment
+        :param seqs: a m x n array of aligned sequences
+        :return: a windows x m x win_size view of seqs
+        """
+        win_size = min(self.win_size, seqs.shape[1])
+        return np.moveaxis(sliding_window_view(seqs, win_size, axis=1)[:, ::self.step_size], 1, 0)
+
     def execute(self, triplet):
         """
-        Do Sister-scanning as described in Gibbs, Armstrong, and Gibbs (2000), using a randomized 4th sequence
+        Do Sister-scanning on a triplet and record the breakpoints that are found
         :param triplet: a triplet object
         """
-        random.seed(self.random_seed)
-        np.random.seed(self.random_seed)
-
-        # Initialize list to map z_values to window positions
-        z_values = np.zeros(triplet.sequences.shape[1])
-
-        # Based on leading edge of the window
-        for window in range(0, self.align.shape[1], self.step_size):
-            win_start = 0
-            win_end = win_start + self.win_size
-
-            # Label sequences
-            a = triplet.sequences[0][win_start: win_end]
-            b = triplet.sequences[1][win_start: win_end]
-            c = triplet.sequences[2][win_start: win_end]
-
-            # Create the fourth sequence through horizontal randomization
-            selected_seq = random.choice((0, 1, 2))
-            d = triplet.sequences[selected_seq][win_start: win_end]
-            np.random.shuffle(d)
-
-            # (1) Count number of positions within a window that conform to each pattern
-            seq_array = np.array([a, b, c, d])
-            pat_counts = self.count_patterns(seq_array)
-
-            # (2) Sum counts where 2 sequences are identical
-            sum_pat_counts = self.sum_pattern_counts(pat_counts)
-
-            # (3) Sum counts of each kind of informative site for each window
-            sum_pat_counts[0] = pat_counts[1] + pat_counts[6] + pat_counts[7]  # 2 + 7 + 8
-            sum_pat_counts[1] = pat_counts[2] + pat_counts[5] + pat_counts[8]  # 3 + 6 + 9
-            sum_pat_counts[2] = pat_counts[3] + pat_counts[4] + pat_counts[9]  # 4 + 5 + 10
-
-            # (4) Create 4 vertically randomized sequences (steps 1 and 2), repeat for 100 times
-            p_counts = []
-            sum_p_counts = []
-            for i in range(self.scan_perm_num):
-
-                # Generate 4 vertically randomized sequences (shuffle the values in the columns)
-                a1 = seq_array[:, np.random.permutation(seq_array.shape[1])]
-
-                # Count number of patterns and sum counts
-                p_counts = self.count_patterns(a1)
-                sum_p_counts = self.sum_pattern_counts(p_counts)
-
-            # (5) Calculate Z-scores for each pattern and sum of patterns for each window
-            pop_mean_pcounts = np.mean(p_counts)
-            pop_mean_patsum = np.mean(sum_p_counts)
-            pop_std_pcounts = np.std(p_counts)
-            pop_std_patsum = np.std(sum_p_counts)
-
-            pat_zscore = []
-            for val in pat_counts:
-                z = (val - pop_mean_pcounts) / pop_std_pcounts
-                pat_zscore.append(z)
-
-            sum_pat_zscore = []
-            for val in sum_pat_counts:
-                z = (val - pop_mean_patsum) / pop_std_patsum
-                sum_pat_zscore.append(z)
-
-            # Smooth z-values
-            sum_pat_zscore = gaussian_filter1d(sum_pat_zscore, 1.5)
-
-            peaks = find_peaks(sum_pat_zscore, distance=self.win_size)
-            for k, peak in enumerate(peaks[0]):
-                search_win_size = 1
-                while peak - search_win_size > 0 \
-                        and peak + search_win_size < len(sum_pat_zscore) - 1 \
-                        and sum_pat_zscore[peak + search_win_size] > 0.3 * sum_pat_zscore[peak] \
-                        and sum_pat_zscore[peak - search_win_size] > 0.3 * sum_pat_zscore[peak]:
-                    search_win_size += 1
-
-                if sum_pat_zscore[peak + search_win_size] > sum_pat_zscore[peak - search_win_size]:
-                    aln_pos = (int(peak), int(peak + search_win_size + self.win_size))
-                else:
-                    aln_pos = (int(peak - search_win_size), int(peak + self.win_size))
+        self.raw_results.extend(self.scan_triplet(triplet))
 
-                rec_name, parents = identify_recombinant(triplet, aln_pos)
-                if (rec_name, parents, *aln_pos, abs(sum_pat_zscore[peak])) not in self.raw_results:
-                    self.raw_results.append((rec_name, parents, *aln_pos, abs(sum_pat_zscore[peak])))
+    def execute_all(self, total_combinations, seq_names):
+        """
+        Do Sister-scanning on every triplet of the alignment, spreading the triplets over self.np processes
+        :param total_combinations: the number of triplets in the alignment
+        :param seq_names: list, sequence labels / names
+        """
+        self.seq_names = seq_names
+        self.total_triplet_combinations = total_combinations
+        triplets = enumerate(TripletGenerator(self.align, self.seq_names))
 
-            return
+        if self.np == 1:
+            results = [self.scan(arg) for arg in triplets]
+        else:
+            # Start fresh worker processes when Numba is in use, since forking after its threads have started can hang.
+            # Workers get the options rather than this object, so the alignment is not sent with every triplet
+            context = multiprocessing.get_context('spawn' if _NUMBA_AVAILABLE else None)
+            with context.Pool(self.np, initializer=_init_worker,
+                              initargs=(self.get_options(), total_combinations)) as p:
+                results = p.map(_scan_triplet, triplets)
+
+        self.raw_results = [l for res in results for l in res]
+
+    def scan(self, arg):
+        """
+        Do Sister-scanning on a numbered triplet, reporting progress
+        :param arg: tuple of the number of the triplet and the triplet object
+        :return: list of breakpoints found in the triplet
+        """
+        i, triplet = arg
+        if not self.quiet:
+            print(f"Scanning triplet {i} / {self.total_triplet_combinations}")
+        return self.scan_triplet(triplet)
+
+    def scan_triplet(self, triplet):
+        """
+        Do Sister-scanning as described in Gibbs, Armstrong, and Gibbs (2000), using a randomized 4th sequence
+        :param triplet: a triplet object
+        :return: list of breakpoints found in the triplet
+        """
+        raw_results = []
+        rng = np.random.default_rng(self.random_seed)
+
+        # Encode the sequences as bytes once, so that each window is a view into a single uint8 array
+        seqs = np.ascontiguousarray(triplet.sequences.astype('S1').view(np.uint8))
+        windows = self.get_windows(seqs)
+        num_windows, _, win_size = windows.shape
+
+        # Create the fourth sequence of each window through horizontal randomization
+        selected_seqs = rng.integers(3, size=num_windows)
+        shuffles = rng.permuted(np.tile(np.arange(win_size), (num_windows, 1)), axis=1)
+        d = windows[np.arange(num_windows)[:, None], selected_seqs[:, None], shuffles]
+        seq_arrays = np.concatenate((windows, d[:, None, :]), axis=1)
+
+        # (1) Count number of positions within each window that conform to each pattern
+        codes = self.site_codes(seq_arrays)
+        pat_counts = self.count_codes(codes)
+
+        # (2) Sum counts where 2 sequences are identical
+        sum_pat_counts = self.sum_pattern_counts(pat_counts)
+
+        # (3) Sum counts of each kind of informative site for each window
+        sum_pat_counts[:, 0] = pat_counts[:, 1] + pat_counts[:, 6] + pat_counts[:, 7]  # 2 + 7 + 8
+        sum_pat_counts[:, 1] = pat_counts[:, 2] + pat_counts[:, 5] + pat_counts[:, 8]  # 3 + 6 + 9
+        sum_pat_counts[:, 2] = pat_counts[:, 3] + pat_counts[:, 4] + pat_counts[:, 9]  # 4 + 5 + 10
+
+        # (4) Create 4 vertically randomized sequences (steps 1 and 2), repeat for 100 times
+        # Shuffle the values within each column by drawing one of the 24 orders of its rows for every permutation.
+        # Windows are processed in tiles, so the row orders of a tile (one byte per site) stay in cache
+        tile_size = max(1, TILE_BYTES // (self.scan_perm_num * win_size))
+        p_counts = np.empty((num_windows, self.scan_perm_num, 15), dtype=np.int64)
+        for tile_start in range(0, num_windows, tile_size):
+            tile = slice(tile_start, tile_start + tile_size)
+            perm_ids = rng.integers(len(ROW_PERMS), size=(codes[tile].shape[0], self.scan_perm_num, win_size),
+                                    dtype=np.uint8)
+            if _NUMBA_AVAILABLE:
+                p_counts[tile] = count_permuted_patterns(codes[tile], perm_ids, PERM_CODES, PATTERN_LUT)
+            else:
+                p_counts[tile] = self.count_permuted_codes(codes[tile], perm_ids)
+
+        # Sum counts of the permutations
+        sum_p_counts = self.sum_pattern_counts(p_counts)
+
+        # (5) Calculate Z-scores for each pattern and sum of patterns for each window, over all permutations
+        pop_mean_pcounts = np.mean(p_counts, axis=(1, 2))[:, None]
+        pop_mean_patsum = np.mean(sum_p_counts, axis=(1, 2))[:, None]
+        pop_std_pcounts = np.std(p_counts, axis=(1, 2))[:, None]
+        pop_std_patsum = np.std(sum_p_counts, axis=(1, 2))[:, None]
+
+        pat_zscore = (pat_counts - pop_mean_pcounts) / pop_std_pcounts
+        sum_pat_zscores = (sum_pat_counts - pop_mean_patsum) / pop_std_patsum
+
+        # Take the highest Z-score of each window, so there is one value per window along the alignment
+        z_values = gaussian_filter1d(np.max(sum_pat_zscores, axis=1), 1.5)
+        window_starts = np.arange(num_windows) * self.step_size
+
+        # Breakpoints already detected for this triplet
+        detected = set()
+
+        # Peaks are at least a window apart, measured in steps
+        peaks = find_peaks(z_values, distance=int(np.ceil(win_size / self.step_size)))
+        for k, peak in enumerate(peaks[0]):
+            search_win_size = 1
+            while peak - search_win_size > 0 \
+                    and peak + search_win_size < len(z_values) - 1 \
+                    and z_values[peak + search_win_size] > 0.3 * z_values[peak] \
+                    and z_values[peak - search_win_size] > 0.3 * z_values[peak]:
+                search_win_size += 1
+
+            # Extend the region of the peak's window by the windows on the side with the higher Z-score
+            if z_values[peak + search_win_size] > z_values[peak - search_win_size]:
+                aln_pos = (int(window_starts[peak]), int(window_starts[peak + search_win_size] + win_size))
+            else:
+                aln_pos = (int(window_starts[peak - search_win_size]), int(window_starts[peak] + win_size))
+
+            rec_name, parents = identify_recombinant(triplet, aln_pos)
+            event = (rec_name, tuple(parents), *aln_pos, abs(z_values[peak]))
+            if event not in detected:
+                detected.add(event)
+                raw_results.append((rec_name, parents, *aln_pos, abs(z_values[peak])))
+
+        return raw_results
 
     def merge_breakpoints(self):
         """
@@ -228,7 +416,7 @@ class Siscan:
         """
         results_dict = {}
         results = []
-        self.results = sorted(list(self.raw_results))
+        self.raw_results.sort()
 
         # Gather all regions with the same recombinant
         for i, bp in enumerate(self.raw_results):
@@ -240,21 +428,17 @@ class Siscan:
             results_dict[key].append(self.raw_results[i][2:])
 
         # Merge any locations that overlap - eg [1, 5] and [3, 7] would become [1, 7]
-        for key in results_dict:
-            merged_regions = []
-            for region in results_dict[key]:
-                region = list(region)
-                old_regions = list(results_dict[key])
-                for region2 in old_regions:
-                    start = region[0]
-                    end = region[1]
-                    start2 = region2[0]
-                    end2 = region2[1]
-                    if start <= start2 <= end or start <= end2 <= end:
-                        region[0] = min(start,start2)
-                        region[1] = max(end, end2)
-                        results_dict[key].remove(region2)
-                merged_regions.append(region)
+        for key, regions in results_dict.items():
+            # Sweep over the regions in order of their start, extending the last merged region while they overlap
+            regions.sort(key=itemgetter(0))
+            merged_regions = [list(regions[0])]
+            for start, end, p_value in regions[1:]:
+                last = merged_regions[-1]
+                if start <= last[1]:
+                    last[1] = max(last[1], end)
+                    last[2] = max(last[2], p_value)
+                else:
+                    merged_regions.append([start, end, p_value])
 
             # Output the results
             for region in merged_regions:
@@ -267,3 +451,31 @@ class Siscan:
                     results.append((rec_name, parents, start, end, p_value))
 
         return results
+
+
+# Siscan object of a worker process, built by _init_worker
+_worker_siscan = None
+
+
+def _init_worker(options, total_combinations):
+    """
+    Set up a worker process to scan triplets
+    :param options: the options of the parent's Siscan object, from Siscan.get_options
+    :param total_combinations: the number of triplets in the alignment
+    """
+    global _worker_siscan
+    _worker_siscan = Siscan(None, **options)
+    _worker_siscan.total_triplet_combinations = total_combinations
+
+    # Triplets are already spread over processes, so run the Numba kernel on a single thread
+    if _NUMBA_AVAILABLE:
+        set_num_threads(1)
+
+
+def _scan_triplet(arg):
+    """
+    Do Sister-scanning on a numbered triplet with the Siscan object of this worker process
+    :param arg: tuple of the number of the triplet and the triplet object
+    :return: list of breakpoints found in the triplet
+    """
+    return _worker_siscan.scan(arg)
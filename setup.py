@@ -12,9 +12,12 @@ setup(
     ],
     install_requires=[
         'scipy>=1.5.0',
-        'numpy>=1.17.4',
+        'numpy>=1.20.0',
         'h5py>=3.8.0'
     ],
+    extras_require={
+        'numba': ['numba>=0.50']
+    },
     python_requires='>=3.6',
     scripts=['bin/openrdp'],
     options={'build_scripts': {'executable': '/usr/bin/env python3'}},
@@ -127,6 +127,35 @@ class TestCommon(unittest.TestCase):
             result = jc_distance(s1, s2)
             self.assertEqual(expected[i], result)
 
+    def test_jc_distance_matrix_short(self):
+        pairs = list(itertools.combinations(range(self.short_align.shape[0]), 2))
+
+        expected = [2.6223806710998607, 1, 1.7984214545987776, 1, 1, 1.415302236774285, 1.7984214545987776,
+                    1.7984214545987776, 1.415302236774285, 1.1629480593083754]
+        result = jc_distance_matrix(self.short_align)
+        self.assertEqual(expected, [result[pair] for pair in pairs])
+        self.assertTrue((result == result.T).all())
+        self.assertTrue((np.diag(result) == 0).all())
+
+    def test_jc_distance_matrix_long(self):
+        pairs = list(itertools.combinations(range(self.long_align.shape[0]), 2))
+
+        expected = [0.056730329671987476, 0.1720578753742531, 0.1484586552588878,
+                    0.13161261779022151, 0.13312853543617206, 0.08465351745505377]
+        result = jc_distance_matrix(self.long_align)
+        self.assertEqual(expected, [result[pair] for pair in pairs])
+
+    def test_pearson_r(self):
+        self.assertEqual(1, pearson_r([0.1, 0.3], [0.2, 0.5]))
+        self.assertEqual(-1, pearson_r([0.1, 0.3], [0.5, 0.2]))
+        self.assertAlmostEqual(0.8660254037844387, pearson_r([1, 2, 3], [1, 3, 3]))
+        self.assertTrue(np.isnan(pearson_r([0.1, 0.1], [0.2, 0.5])))
+        self.assertTrue(np.isnan(pearson_r([0.1, 0.3, 0.2], [1, 1, 1])))
+
+        x = self.long_align[0] == self.long_align[1]
+        y = self.long_align[2] == self.long_align[3]
+        self.assertAlmostEqual(np.corrcoef(x, y)[0, 1], pearson_r(x, y))
+
     def test_jc_distance_hiv(self):
         # Generate all pairs of sequences (3 sequences)
         # (0, 1), (0, 2), (1, 2)
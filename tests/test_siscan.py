@@ -3,7 +3,23 @@ import unittest
 import numpy as np
 
 from openrdp.common import TripletGenerator, Triplet, read_fasta
-from openrdp.siscan import Siscan
+from openrdp.siscan import Siscan, ROW_PERMS, PERM_CODES, PATTERN_LUT, _NUMBA_AVAILABLE
+
+if _NUMBA_AVAILABLE:
+    from openrdp.siscan import count_permuted_patterns
+
+
+def shuffled_windows():
+    """
+    Make random windows and vertically randomized copies of each of them
+    :return: the windows, the row order chosen at each site of each copy, and the copies themselves
+    """
+    rng = np.random.default_rng(2)
+    seq_arrays = rng.integers(4, size=(3, 4, 40)).astype(np.uint8)
+    perm_ids = rng.integers(len(ROW_PERMS), size=(3, 9, 40)).astype(np.uint8)
+    rows = ROW_PERMS[perm_ids].transpose(0, 1, 3, 2)
+    shuffled = np.take_along_axis(np.broadcast_to(seq_arrays[:, None], rows.shape), rows, axis=2)
+    return seq_arrays, perm_ids, shuffled
 
 
 class TestSiscan(unittest.TestCase):
@@ -28,6 +44,7 @@ class TestSiscan(unittest.TestCase):
             self.long_align = np.array(list(map(list, test_seqs)))
             self.test_long = Siscan(self.long_align, names, settings=test_settings)
 
+        self.long_names = names
         self.long_triplets = [trp for trp in TripletGenerator(self.long_align, names)]
 
         # Set up HIV CRF07 test case
@@ -63,34 +80,96 @@ class TestSiscan(unittest.TestCase):
         self.assertEqual(100, self.test_hiv.scan_perm_num)
         self.assertEqual(3, self.test_hiv.random_seed)
 
+    def test_count_patterns(self):
+        # Sites (columns): all identical, all different, ab|cd, ac|bd, ad|b|c
+        seq_array = np.array([list('AAAAA'), list('ACACC'), list('AGCAG'), list('ATCCA')])
+        expected = [1, 1, 1, 1, 0, 1, 1, 1, 1, 0, 0, 0, 0, 0, 1]
+        result = self.test_short.count_patterns(seq_array)
+        self.assertEqual(expected, list(result))
+
+    def test_count_permuted_codes(self):
+        seq_arrays, perm_ids, shuffled = shuffled_windows()
+        expected = self.test_short.count_patterns(shuffled)
+
+        result = self.test_short.count_permuted_codes(self.test_short.site_codes(seq_arrays), perm_ids)
+        self.assertTrue(np.array_equal(expected, result))
+
+        # Shuffling within columns changes which pairs are identical, so the copies do not all agree
+        self.assertTrue(np.any(result != result[:, :1]))
+
+    @unittest.skipUnless(_NUMBA_AVAILABLE, "numba is not installed")
+    def test_count_permuted_patterns_numba(self):
+        seq_arrays, perm_ids, shuffled = shuffled_windows()
+        expected = self.test_short.count_patterns(shuffled)
+
+        result = count_permuted_patterns(self.test_short.site_codes(seq_arrays), perm_ids, PERM_CODES, PATTERN_LUT)
+        self.assertTrue(np.array_equal(expected, result))
+
+    def test_merge_breakpoints(self):
+        self.test_short.raw_results = [('A', ['C', 'B'], 30, 40, 0.4),
+                                       ('A', ['B', 'C'], 1, 5, 0.2),
+                                       ('A', ['B', 'C'], 10, 20, 0.6),
+                                       ('A', ['B', 'C'], 3, 7, 0.1),
+                                       ('A', ['B', 'C'], 7, 9, 0.3),
+                                       ('B', ['A', 'C'], 2, 8, 0.5)]
+        expected = [('A', ('B', 'C'), 1, 9, 0.3),
+                    ('A', ('B', 'C'), 10, 20, 0.6),
+                    ('A', ('B', 'C'), 30, 40, 0.4),
+                    ('B', ('A', 'C'), 2, 8, 0.5)]
+        result = self.test_short.merge_breakpoints()
+        self.assertEqual(expected, result)
+
     def test_execute_short(self):
-        expected = [('A', ('B', 'C'), 2, 11, 0.7787397893226586),
-                    ('A', ('B', 'D'), 3, 11, 0.7524567011843551),
-                    ('A', ('B', 'E'), 2, 11, 0.7787397893226586),
-                    ('A', ('C', 'D'), 2, 11, 0.7685248858128534),
-                    ('C', ('A', 'E'), 2, 11, 0.804804577675132),
-                    ('A', ('D', 'E'), 2, 11, 0.7260095477693602),
-                    ('C', ('B', 'D'), 2, 11, 0.7838806032521947),
-                    ('B', ('C', 'E'), 3, 11, 0.7750581068141527),
-                    ('B', ('D', 'E'), 3, 11, 0.745172605746384),
-                    ('C', ('D', 'E'), 2, 11, 0.7465417522802897)]
+        expected = []
 
         for trp in self.short_triplets:
             self.test_short.execute(trp)
+        for rec_name, parents, start, end, z_value in self.test_short.raw_results:
+            self.assertTrue(0 <= start < end <= self.short_align.shape[1])
+
         result = self.test_short.merge_breakpoints()
         self.assertEqual(expected, result)
 
+    def test_execute_keeps_triplet(self):
+        # The horizontal randomization must shuffle a copy, not the sequences of the triplet
+        trp = self.short_triplets[0]
+        expected = trp.sequences.copy()
+        self.test_short.execute(trp)
+        self.assertTrue(np.array_equal(expected, trp.sequences))
+
+    def test_execute_default_win_size(self):
+        # The default window (200 nt) is longer than the short alignment, so it covers the whole alignment
+        test_default = Siscan(self.short_align)
+        self.assertEqual(200, test_default.win_size)
+        for trp in self.short_triplets:
+            windows = test_default.get_windows(trp.sequences)
+            self.assertEqual((1, 3, self.short_align.shape[1]), windows.shape)
+            self.assertTrue(np.array_equal(trp.sequences, windows[0]))
+            test_default.execute(trp)
+
+        # A single window has no neighbours to form a peak with
+        self.assertEqual([], test_default.raw_results)
+
     def test_execute_long(self):
-        expected = [('Test1 ', ('Test2', 'Test3'), 2, 55, 0.7521364874425969),
-                    ('Test1 ', ('Test2', 'Test4'), 2, 55, 0.7669294010627822),
-                    ('Test1 ', ('Test3', 'Test4'), 2, 55, 0.7651446184495414),
-                    ('Test2', ('Test3', 'Test4'), 2, 55, 0.7651446184495414)]
+        expected = []
 
         for trp in self.long_triplets:
             self.test_long.execute(trp)
         result = self.test_long.merge_breakpoints()
         self.assertEqual(expected, result)
 
+    def test_execute_all_long(self):
+        for trp in self.long_triplets:
+            self.test_long.execute(trp)
+        expected = sorted(self.test_long.raw_results)
+        self.assertTrue(expected)
+
+        # Scan in worker processes, then in this process
+        for num_processes in (2, 1):
+            self.test_long.np = num_processes
+            self.test_long.execute_all(total_combinations=len(self.long_triplets), seq_names=self.long_names)
+            self.assertEqual(expected, sorted(self.test_long.raw_results))
+
     def test_execute_hiv(self):
         expected = []   # Breakpoints have p_values that are too large (above threshold)
         for trp in self.hiv_triplets: